@@ -1,40 +1,74 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
-from datetime import datetime, timedelta
-from collections import defaultdict
-import json
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from heapq import nlargest
+from itertools import groupby
+from operator import itemgetter
+import orjson
 import os
+import tempfile
 
 st.set_page_config(page_title="📅 Attendance Policy Planner", layout="wide")
 
 POLICY_DAYS_REQUIRED = 24
 DATA_FILE = "attendance_data.json"
 
-def get_week_start(date):
-    return date - timedelta(days=date.weekday())
+# Per-day status codes used in the day/status arrays
+STATUS_OFFICE = 1
+STATUS_WFH = 2
+
+# Caches are process-global and keyed on the marked days, so keep only recent states
+CACHE_MAX_ENTRIES = 8
+
+BASE_COLORS = {
+    "Office Days": "#1f77b4",
+    "WFH Days": "#ff7f0e",
+    "Suggested Days": "#2ca02c",
+}
+
+@lru_cache(maxsize=4096)
+def get_week_start(d):
+    return d - timedelta(days=d.weekday())
 
 def generate_weeks(start_date, num_weeks):
-    return [get_week_start(start_date - timedelta(weeks=w)) for w in range(num_weeks)]
-
-def summarize_weeks(attendance):
-    summary = {}
-    for d in attendance:
-        week_start = get_week_start(d)
-        summary.setdefault(week_start, []).append(d)
-    return {k: len(v) for k, v in summary.items()}
-
-def best_8_week_attendance(attendance, reference_date):
-    cutoff = get_week_start(reference_date)
-    past_12_weeks = [cutoff - timedelta(weeks=w) for w in range(1, 13)]
-    relevant_days = [d for d in attendance if get_week_start(d) in past_12_weeks]
-    summary = summarize_weeks(relevant_days)
-    best_8 = sorted(summary.items(), key=lambda x: x[1], reverse=True)[:8]
+    start_week = np.datetime64(get_week_start(start_date), "D")
+    weeks = start_week - np.arange(num_weeks).astype("timedelta64[W]")
+    return weeks.astype("datetime64[D]").tolist()
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def build_day_status(attendance: frozenset, ooo: frozenset):
+    # Sorted datetime64[D] days with a parallel int8 status array
+    dates = np.array(sorted(attendance | ooo), dtype="datetime64[D]")
+    office = np.isin(dates, np.array(list(attendance), dtype="datetime64[D]"))
+    status = np.where(office, STATUS_OFFICE, STATUS_WFH).astype(np.int8)
+    return dates, status
+
+def week_starts_of(dates):
+    # 1970-01-01 was a Thursday, so (days since epoch + 3) % 7 is the weekday with Monday=0
+    return dates - ((dates.astype(np.int64) + 3) % 7).astype("timedelta64[D]")
+
+def summarize_weeks(week_starts):
+    weeks, counts = np.unique(week_starts, return_counts=True)
+    # tolist() turns datetime64[D] back into date objects
+    return dict(zip(weeks.tolist(), counts.tolist()))
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def best_8_week_attendance(dates, status, reference_date):
+    cutoff = np.datetime64(get_week_start(reference_date), "D")
+    week_starts = week_starts_of(dates[status == STATUS_OFFICE])
+    # Only the 12 weeks before the reference week count
+    in_window = (week_starts >= cutoff - np.timedelta64(12 * 7, "D")) & (week_starts < cutoff)
+    summary = summarize_weeks(week_starts[in_window])
+    best_8 = nlargest(8, summary.items(), key=itemgetter(1))
     best_weeks = [week_start for week_start, _ in best_8]
     return sum(days for _, days in best_8), summary, best_8
 
-def calculate_future_needs(summary, ooo_days, reference_date):
-    today = datetime.today().date()
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def calculate_future_needs(current_total, dates, status, reference_date, today):
+    # today is passed in (not read here) so cached plans expire with the date
     start_week = get_week_start(today)
     end_week = get_week_start(reference_date + timedelta(weeks=5))
 
@@ -42,45 +76,107 @@ def calculate_future_needs(summary, ooo_days, reference_date):
     num_weeks = (end_week - start_week).days // 7 + 1
     candidate_weeks = [start_week + timedelta(weeks=w) for w in range(num_weeks)]
 
-    # Calculate current total from best 8 weeks
-    current_total = sum(sorted(summary.values(), reverse=True)[:8])
+    # current_total is the best-8-weeks total from best_8_week_attendance
     shortfall = max(POLICY_DAYS_REQUIRED - current_total, 0)
 
-    plan = {}
+    # candidate_weeks is chronological, so the plan keeps that order without sorting
+    plan = dict.fromkeys(candidate_weeks, 0)
+    if shortfall == 0:
+        return plan
+
+    # Count OOO days per week once instead of rescanning them for every week
+    ooo_by_week = summarize_weeks(week_starts_of(dates[status == STATUS_WFH]))
+
     for week in candidate_weeks:
         # Max 3 office days can be suggested per week (per policy), minus any OOO days
-        available_days = min(3, 5 - len([d for d in ooo_days if get_week_start(d) == week]))
+        available_days = min(3, 5 - ooo_by_week.get(week, 0))
         plan[week] = min(available_days, shortfall)
         shortfall -= plan[week]
         if shortfall <= 0:
             break
 
-    # Fill the rest with 0
-    for week in candidate_weeks:
-        if week not in plan:
-            plan[week] = 0
+    return plan
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRIES)
+def build_week_table(dates, status, weeks: tuple, needs):
+    week_starts = week_starts_of(dates)
+    office_counts = pd.Series(summarize_weeks(week_starts[status == STATUS_OFFICE]), dtype=int)
+    ooo_counts = pd.Series(summarize_weeks(week_starts[status == STATUS_WFH]), dtype=int)
+
+    return pd.DataFrame({
+        "Week": pd.DatetimeIndex(weeks).strftime("%b %d"),
+        "Office Days": office_counts.reindex(weeks, fill_value=0).values,
+        "WFH Days": ooo_counts.reindex(weeks, fill_value=0).values,
+        "Suggested Days": [needs.get(week, 0) for week in weeks],
+    })
+
+# Cached as a resource so identical inputs reuse the same figure instead of rebuilding it.
+# The figure is shared across reruns and sessions, so callers must not mutate it;
+# only recent states are useful, so the cache is bounded like the others.
+@st.cache_resource(max_entries=CACHE_MAX_ENTRIES)
+def build_projection_figure(dates, status, weeks: tuple, needs, aligned_week_str):
+    df = build_week_table(dates, status, weeks, needs)
+
+    # Melt to long format for stacked bar chart
+    df_long = df.melt(id_vars="Week", value_vars=["Office Days", "WFH Days", "Suggested Days"],
+                        var_name="Type", value_name="Days")
+
+    # Mark aligned week in df
+    df['Aligned Week'] = False
+    if aligned_week_str is not None:
+        df.loc[df['Week'] == aligned_week_str, 'Aligned Week'] = True
+
+    # Assign colors, highlight aligned week Suggested Days in red
+    df_long = df_long.merge(df[['Week', 'Aligned Week']], on='Week', how='left')
+    df_long['Color'] = np.where(
+        (df_long['Type'] == "Suggested Days") & df_long['Aligned Week'],
+        "#d62728",  # red highlight
+        df_long['Type'].map(BASE_COLORS),
+    )
+
+    fig = px.bar(
+        df_long,
+        x="Week",
+        y="Days",
+        color="Type",
+        barmode="stack",
+        title="Office vs WFH Days (12 Weeks Prior + 6 Weeks Future)",
+        color_discrete_map=BASE_COLORS,
+    )
 
-    return dict(sorted(plan.items()))  # Ensure chronological order
+    # Update bar colors manually for the aligned week bars
+    color_map = dict(zip(zip(df_long['Week'], df_long['Type']), df_long['Color']))
+    for trace in fig.data:
+        trace.marker.color = [color_map.get((x_val, trace.name), BASE_COLORS[trace.name]) for x_val in trace.x]
 
+    return fig
 
-def serialize_dates(date_set):
-    return [d.isoformat() for d in date_set]
 
 def deserialize_dates(date_list):
-    return set(pd.to_datetime(d).date() for d in date_list)
+    return {date.fromisoformat(d) for d in date_list}
 
 def save_data(attendance_set, ooo_set):
+    # orjson writes date objects as ISO strings natively
     data = {
-        "attendance": serialize_dates(attendance_set),
-        "ooo": serialize_dates(ooo_set),
+        "attendance": sorted(attendance_set),
+        "ooo": sorted(ooo_set),
     }
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f)
+    # Unique temp file per save, since concurrent sessions share this process
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(DATA_FILE)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(orjson.dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, DATA_FILE)  # atomic swap so a crash never leaves a partial file
+    except BaseException:
+        os.remove(tmp_file)
+        raise
 
 def load_data():
     if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "r") as f:
-            data = json.load(f)
+        with open(DATA_FILE, "rb") as f:
+            data = orjson.loads(f.read())
         attendance = deserialize_dates(data.get("attendance", []))
         ooo = deserialize_dates(data.get("ooo", []))
         return attendance, ooo
@@ -90,6 +186,7 @@ if "attendance" not in st.session_state or "ooo" not in st.session_state:
     attendance, ooo = load_data()
     st.session_state.attendance = attendance
     st.session_state.ooo = ooo
+    st.session_state._dirty = False
 
 st.title("🏢 Office Attendance Policy Tracker")
 
@@ -105,58 +202,75 @@ if selected_future_week.weekday() != 0:
     st.error("Please select a Monday!")
     st.stop()
 
+# Weeks shown in both the calendar and the chart (12 past + 6 future)
+past_weeks = generate_weeks(selected_future_week - timedelta(weeks=1), 12)[::-1]
+future_weeks = [get_week_start(selected_future_week + timedelta(weeks=w)) for w in range(0, 6)]
+combined_weeks = past_weeks + future_weeks
+
+# combined_weeks is already chronological, so consecutive grouping is enough
+months = []
+for _, group in groupby(combined_weeks, key=lambda w: (w.year, w.month)):
+    week_starts = list(group)
+    months.append((week_starts[0].strftime("%B %Y"), week_starts))
+
 # === Main layout with 2 columns ===
 col_calendar, col_summary = st.columns([2, 1])
 
 with col_calendar:
     st.header("🗓️ Mark Attendance and WFH (Past + Future)")
 
-    # past_weeks = generate_weeks(selected_future_week, 12)[::-1]
-    past_weeks = generate_weeks(selected_future_week - timedelta(weeks=1), 12)[::-1]
-    future_weeks = [get_week_start(selected_future_week + timedelta(weeks=w)) for w in range(0, 6)]
-    combined_weeks = past_weeks + future_weeks
-
-    months = defaultdict(list)
-    for week_start in combined_weeks:
-        months[week_start.strftime("%B %Y")].append(week_start)
-
-    for month, week_starts in months.items():
-        with st.expander(month, expanded=False):  # collapsed by default
-            for week_index, week_start in enumerate(week_starts):
-                st.markdown(f"#### 📆 Week of {week_start.strftime('%b %d, %Y')}")
-                cols = st.columns(5)
-                for i in range(5):
-                    day = week_start + timedelta(days=i)
-                    base_key = f"{day.strftime('%Y-%m-%d')}_week{week_index}"
-                    radio_key = f"status_{base_key}"
-                    with cols[i]:
-                        st.markdown(f"**{day.strftime('%a %b %d')}**")
-
-                        default_index = 0
-                        if day in st.session_state.attendance:
-                            default_index = 1
-                        elif day in st.session_state.ooo:
-                            default_index = 2
-
-                        status = st.radio(
-                            label="Status",  # non-empty label for accessibility
-                            options=["None", "🏢 Office", "🏖️ WFH"],
-                            index=default_index,
-                            key=radio_key,
-                            label_visibility="collapsed"  # visually hidden but accessible
-                        )
-
-                        if status == "🏢 Office":
-                            st.session_state.attendance.add(day)
-                            st.session_state.ooo.discard(day)
-                        elif status == "🏖️ WFH":
-                            st.session_state.ooo.add(day)
-                            st.session_state.attendance.discard(day)
-                        else:  # None
-                            st.session_state.attendance.discard(day)
-                            st.session_state.ooo.discard(day)
-
-    save_data(st.session_state.attendance, st.session_state.ooo)
+    # Batch edits in a form so radio clicks don't rerun the whole app
+    with st.form("attendance_form"):
+        # Status code per marked day doubles as the radio index (0=None, 1=Office, 2=WFH);
+        # Office is applied last so it wins for a day stored in both sets
+        status_by_day = {d: STATUS_WFH for d in st.session_state.ooo}
+        status_by_day.update({d: STATUS_OFFICE for d in st.session_state.attendance})
+
+        for month, week_starts in months:
+            with st.expander(month, expanded=False):  # collapsed by default
+                for week_index, week_start in enumerate(week_starts):
+                    st.markdown(f"#### 📆 Week of {week_start.strftime('%b %d, %Y')}")
+                    cols = st.columns(5)
+                    for i in range(5):
+                        day = week_start + timedelta(days=i)
+                        base_key = f"{day.strftime('%Y-%m-%d')}_week{week_index}"
+                        radio_key = f"status_{base_key}"
+                        with cols[i]:
+                            st.markdown(f"**{day.strftime('%a %b %d')}**")
+
+                            default_index = status_by_day.get(day, 0)
+
+                            status = st.radio(
+                                label="Status",  # non-empty label for accessibility
+                                options=["None", "🏢 Office", "🏖️ WFH"],
+                                index=default_index,
+                                key=radio_key,
+                                label_visibility="collapsed"  # visually hidden but accessible
+                            )
+
+                            # The sets already hold the previous value, so only apply real changes
+                            # (an Office day still listed as WFH is cleaned up here too)
+                            if status == "🏢 Office" and (
+                                default_index != STATUS_OFFICE or day in st.session_state.ooo
+                            ):
+                                st.session_state.attendance.add(day)
+                                st.session_state.ooo.discard(day)
+                                st.session_state._dirty = True
+                            elif status == "🏖️ WFH" and default_index != STATUS_WFH:
+                                st.session_state.ooo.add(day)
+                                st.session_state.attendance.discard(day)
+                                st.session_state._dirty = True
+                            elif status == "None" and default_index != 0:
+                                st.session_state.attendance.discard(day)
+                                st.session_state.ooo.discard(day)
+                                st.session_state._dirty = True
+
+        submitted = st.form_submit_button("Save")
+
+    # Only write on submit, and only when a day's status actually changed
+    if submitted and st.session_state._dirty:
+        save_data(st.session_state.attendance, st.session_state.ooo)
+        st.session_state._dirty = False
 
 with col_summary:
     st.header("📊 Attendance Policy Projection")
@@ -164,10 +278,15 @@ with col_summary:
     # create two columns for metrics
     col1, col2 = st.columns(2)
 
+    # Vectorized view of the marked days shared by every projection below
+    dates, status = build_day_status(
+        frozenset(st.session_state.attendance), frozenset(st.session_state.ooo)
+    )
+
     with col1:
-        past_days, past_summary, best_weeks = best_8_week_attendance(st.session_state.attendance, selected_future_week)
-        future_attendance = [d for d in st.session_state.attendance if d >= selected_future_week]
-        total_projected = past_days + len(future_attendance)
+        past_days, _, best_weeks = best_8_week_attendance(dates, status, selected_future_week)
+        future_attendance = (status == STATUS_OFFICE) & (dates >= np.datetime64(selected_future_week, "D"))
+        total_projected = past_days + int(np.count_nonzero(future_attendance))
 
         st.metric("Best 8 Weeks (Prior to Selected Week)", f"{past_days} days")
         st.metric(
@@ -196,30 +315,7 @@ with col_summary:
         st.warning(f"⚠️ You need {POLICY_DAYS_REQUIRED - total_projected} more days by {selected_future_week.strftime('%b %d')}.")
 
     st.subheader("📅 Suggested Office Days Needed Per Week")
-    needs = calculate_future_needs(past_summary, st.session_state.ooo, selected_future_week)
-
-    # Prepare data for chart and cumulative calculation
-    past_weeks = generate_weeks(selected_future_week - timedelta(weeks=1), 12)[::-1]
-    future_weeks = [get_week_start(selected_future_week + timedelta(weeks=w)) for w in range(0, 6)]
-    all_weeks = past_weeks + future_weeks
-
-    data = []
-    for week in all_weeks:
-        office_days = len([d for d in st.session_state.attendance if get_week_start(d) == week])
-        ooo_days = len([d for d in st.session_state.ooo if get_week_start(d) == week])
-        suggested_days = needs.get(week, 0)
-        data.append({
-            "Week": week.strftime("%b %d"),
-            "Office Days": office_days,
-            "WFH Days": ooo_days,
-            "Suggested Days": suggested_days,
-        })
-
-    df = pd.DataFrame(data)
-
-    # Melt to long format for stacked bar chart
-    df_long = df.melt(id_vars="Week", value_vars=["Office Days", "WFH Days", "Suggested Days"],
-                        var_name="Type", value_name="Days")
+    needs = calculate_future_needs(past_days, dates, status, selected_future_week, today)
 
     # --- Calculate cumulative totals to find alignment week ---
     past_total = past_days
@@ -237,51 +333,20 @@ with col_summary:
             aligned_week_index = idx
             break
 
-    # Mark aligned week in df
-    df['Aligned Week'] = False
     aligned_week_str = None
     if aligned_week_index is not None:
         aligned_week_str = future_weeks_keys[aligned_week_index].strftime("%b %d")
-        df.loc[df['Week'] == aligned_week_str, 'Aligned Week'] = True
 
-    # Assign colors, highlight aligned week Suggested Days in red
-    base_colors = {
-        "Office Days": "#1f77b4",
-        "WFH Days": "#ff7f0e",
-        "Suggested Days": "#2ca02c",
-    }
+    # Chart is hidden by default; building the figure is the heaviest part of a rerun
+    if "show_projection_chart" not in st.session_state:
+        st.session_state.show_projection_chart = False
 
-    def get_color(row):
-        if row["Type"] == "Suggested Days" and row["Aligned Week"]:
-            return "#d62728"  # red highlight
-        return base_colors[row["Type"]]
-
-    df_long = df_long.merge(df[['Week', 'Aligned Week']], on='Week', how='left')
-    df_long['Color'] = df_long.apply(get_color, axis=1)
-
-    fig = px.bar(
-        df_long,
-        x="Week",
-        y="Days",
-        color="Type",
-        barmode="stack",
-        title="Office vs WFH Days (12 Weeks Prior + 6 Weeks Future)",
-        color_discrete_map=base_colors,
-    )
+    if st.button("📈 Toggle Projection Chart"):
+        st.session_state.show_projection_chart = not st.session_state.show_projection_chart
 
-    # Update bar colors manually for the aligned week bars
-    for i, trace in enumerate(fig.data):
-        colors = []
-        for j, x_val in enumerate(trace.x):
-            # Find color for each bar segment from df_long by matching x and trace name
-            mask = (df_long['Week'] == x_val) & (df_long['Type'] == trace.name)
-            if not mask.any():
-                colors.append(base_colors[trace.name])
-            else:
-                colors.append(df_long.loc[mask, 'Color'].values[0])
-        trace.marker.color = colors
-
-    st.plotly_chart(fig, use_container_width=True)
+    if st.session_state.show_projection_chart:
+        fig = build_projection_figure(dates, status, tuple(combined_weeks), needs, aligned_week_str)
+        st.plotly_chart(fig, use_container_width=True)
 
     # Show aligned week message
     if aligned_week_index is not None: